@@ -26,11 +26,29 @@ EXTERNAL_API_KEY = os.getenv("EXTERNAL_API_KEY", "your-api-key")
 
 # Face recognition configuration
 FACE_RECOGNITION_THRESHOLD = 95
+# "local" (InsightFace embeddings + FAISS) or "rekognition" (AWS)
+FACE_RECOGNITION_BACKEND = os.getenv("FACE_RECOGNITION_BACKEND") or "local"
+# Minimum cosine similarity for the local embedding backend
+LOCAL_FACE_RECOGNITION_THRESHOLD = float(os.getenv("LOCAL_FACE_RECOGNITION_THRESHOLD") or "0.5")
+# Directory holding the InsightFace buffalo_s model pack (under models/buffalo_s)
+INSIGHTFACE_ROOT = os.getenv("INSIGHTFACE_ROOT") or "~/.insightface"
+# OpenCV YuNet model used to skip frames without faces
+# (a blank value in .env falls back to the default path)
+FACE_DETECTOR_MODEL_PATH = (
+    os.getenv("FACE_DETECTOR_MODEL_PATH")
+    or str(BASE_DIR / "models" / "face_detection_yunet_2023mar.onnx")
+)
 
 # Device configuration
 DEVICE_ID = os.getenv("DEVICE_ID", "DEVICE_001")
 CAMERA_INDEX = int(os.getenv("CAMERA_INDEX", "0"))
 
+# Show the camera window with recognition overlay (disable on headless kiosks)
+ATTENDANCE_UI = os.getenv("ATTENDANCE_UI", "0") == "1"
+
+# Port for the Prometheus metrics endpoint (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "0")
+
 # Sync intervals (in minutes)
 STUDENT_SYNC_INTERVAL = int(os.getenv("STUDENT_SYNC_INTERVAL", "1"))  # 1 hour 60
 ATTENDANCE_SYNC_INTERVAL = int(os.getenv("ATTENDANCE_SYNC_INTERVAL", "1"))  # 5 minutes 5
@@ -1,79 +1,411 @@
 import cv2
 import boto3
+import numpy as np
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 import threading
 import time
 import os
+import hashlib
+import signal
+from collections import OrderedDict
 from datetime import datetime
+from queue import Queue, Empty, Full
 from ..utils.logging_utils import get_logger
+from ..utils.metrics_utils import PipelineMetrics
 from ..database.models import AttendanceRecord
 from dotenv import load_dotenv
-from attendance_system.config.settings import FACE_RECOGNITION_THRESHOLD
+from attendance_system.config.settings import (
+    FACE_RECOGNITION_THRESHOLD,
+    FACE_RECOGNITION_BACKEND,
+    LOCAL_FACE_RECOGNITION_THRESHOLD,
+    INSIGHTFACE_ROOT,
+    FACE_DETECTOR_MODEL_PATH,
+    METRICS_PORT,
+    ATTENDANCE_UI
+)
 
 
 logger = get_logger(__name__)
 load_dotenv()
 
+# Size of the InsightFace ArcFace embedding
+FACE_EMBEDDING_SIZE = 512
+
+# Input size of the YuNet face detector
+FACE_DETECTOR_INPUT_SIZE = (320, 240)
+
 class FaceRecognitionProcessor:
     def __init__(self, device_id: str, recognition_interval: int = 5):
         self.device_id = device_id
         self.recognition_interval = recognition_interval  # seconds
-        self.last_recognition_times = {}  # To prevent duplicate recognitions
+        # To prevent duplicate recognitions: {enrollment_code: monotonic time}, oldest first
+        self.last_recognition_times = OrderedDict()
+        self.max_tracked_recognitions = 4096
         self.camera = None
         self.is_running = False
-        
-        # Initialize AWS Rekognition client
-        self.rekognition_client = boto3.client('rekognition',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION')
-        )
+        self.backend = FACE_RECOGNITION_BACKEND
+        self.metrics = PipelineMetrics(device_id, port=METRICS_PORT)
         
         # Define faces directory
         self.faces_directory = "faces/"  # You can make this configurable
+        self.embeddings_path = os.path.join(self.faces_directory, "embeddings.npz")
+        
+        # Stored faces seen in the faces directory: {enrollment_code: (path, mtime, hash)}.
+        # Image bytes are only read while indexing, not kept in memory
+        self._faces_cache = {}
+        self.faces_check_interval = 30  # seconds between faces directory checks
+        self._load_faces_cache()
+        
+        if self.backend == 'rekognition':
+            # Initialize AWS Rekognition client, shared by all indexing threads
+            self.rekognition_client = boto3.client('rekognition',
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                region_name=os.getenv('AWS_REGION'),
+                config=Config(max_pool_connections=32)
+            )
+            self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rekognition")
+            self.upload_max_dim = 320  # Largest side of the image sent to Rekognition
+            
+            # libjpeg-turbo encodes straight into a bytes object, fall back to OpenCV without it
+            try:
+                from turbojpeg import TurboJPEG
+                self._jpeg_encoder = TurboJPEG()
+            except Exception as e:
+                logger.warning(f"TurboJPEG not available, using OpenCV JPEG encoder: {e}")
+                self._jpeg_encoder = None
+            self.collection_id = f"attendance-{device_id}"
+            self._sync_collection()
+        else:
+            # Initialize local face embedding model
+            from insightface.app import FaceAnalysis
+            # Only detection and recognition are needed; skipping the landmark and
+            # gender/age models saves three extra inferences per detected face
+            self.face_analyzer = FaceAnalysis(
+                name='buffalo_s',
+                root=INSIGHTFACE_ROOT,
+                allowed_modules=['detection', 'recognition'],
+                providers=['CUDAExecutionProvider', 'CPUExecutionProvider']
+            )
+            self.face_analyzer.prepare(ctx_id=0, det_size=(640, 640))
+            # The index is rebuilt by the faces refresh thread and swapped under this lock
+            self._index_lock = threading.Lock()
+            self.index = None
+            self.index_codes = []
+            self._build_index()
+        
+        # Local face detector to skip frames without faces
+        self.face_detector = None
+        if os.path.exists(FACE_DETECTOR_MODEL_PATH):
+            if self._cuda_available():
+                # Run the detector on the GPU when OpenCV is built with CUDA
+                self.face_detector = cv2.FaceDetectorYN.create(
+                    FACE_DETECTOR_MODEL_PATH, '', FACE_DETECTOR_INPUT_SIZE,
+                    backend_id=cv2.dnn.DNN_BACKEND_CUDA,
+                    target_id=cv2.dnn.DNN_TARGET_CUDA
+                )
+                logger.info("Face detector running on CUDA")
+            else:
+                self.face_detector = cv2.FaceDetectorYN.create(FACE_DETECTOR_MODEL_PATH, '', FACE_DETECTOR_INPUT_SIZE)
+        elif self.backend == 'rekognition':
+            # Every ungated frame is a billed Rekognition call
+            logger.error(
+                f"Face detector model not found at {FACE_DETECTOR_MODEL_PATH}, "
+                f"every frame will be sent to Rekognition"
+            )
+        else:
+            logger.warning(f"Face detector model not found at {FACE_DETECTOR_MODEL_PATH}, every frame will be compared")
         
         self.last_recognition_text = None
         self.text_display_time = None
         self.text_duration = 2  # Duration in seconds
+        self.show_ui = ATTENDANCE_UI
+        self.display_interval = 0.1  # Seconds between decoded frames shown on screen
+        
+        # Bounded queues between the reader, worker and display stages
+        self.read_queue = Queue(maxsize=2)
+        self.display_queue = Queue(maxsize=2)
+
+    @staticmethod
+    def _cuda_available():
+        """Check whether OpenCV was built with CUDA and a GPU is present"""
+        try:
+            return cv2.cuda.getCudaEnabledDeviceCount() > 0
+        except (AttributeError, cv2.error):
+            return False
 
+    @staticmethod
+    def _largest_face(faces):
+        """Return the face with the biggest bounding box"""
+        return max(faces, key=lambda face: (face.bbox[2] - face.bbox[0]) * (face.bbox[3] - face.bbox[1]))
+
+    @staticmethod
+    def _read_face(face_path):
+        """Read the bytes of a stored face image"""
+        with open(face_path, 'rb') as stored_face:
+            return stored_face.read()
+
+    def _load_faces_cache(self):
+        """Record new or changed stored faces, returns True if anything changed"""
+        faces_cache = {}
+        changed = False
+        try:
+            face_files = os.listdir(self.faces_directory)
+        except FileNotFoundError:
+            # A fresh device has no faces until the first student sync
+            logger.warning(f"Faces directory {self.faces_directory} not found, no stored faces loaded")
+            face_files = []
         
+        for face_file in face_files:
+            if not face_file.lower().endswith(('.png', '.jpg', '.jpeg')):
+                continue
+
+            # Get enrollment code from filename (without extension)
+            enrollment_code = os.path.splitext(face_file)[0]
+            face_path = os.path.join(self.faces_directory, face_file)
+            try:
+                mtime = os.stat(face_path).st_mtime
+                cached = self._faces_cache.get(enrollment_code)
+                if cached and cached[1] == mtime:
+                    faces_cache[enrollment_code] = cached
+                    continue
+
+                face_hash = hashlib.sha256(self._read_face(face_path)).hexdigest()
+                faces_cache[enrollment_code] = (face_path, mtime, face_hash)
+                changed = True
+            except OSError as e:
+                logger.error(f"Error reading stored face {face_file}: {e}")
+
+        if faces_cache.keys() != self._faces_cache.keys():
+            changed = True
+        self._faces_cache = faces_cache
+        if changed:
+            logger.info(f"Loaded {len(faces_cache)} stored faces")
+        return changed
+
+    def _faces_refresh_loop(self):
+        """Pick up changes in the faces directory off the recognition path"""
+        last_check_time = time.monotonic()
+        
+        while self.is_running:
+            time.sleep(1)
+            if time.monotonic() - last_check_time < self.faces_check_interval:
+                continue
+            last_check_time = time.monotonic()
+            
+            try:
+                if not self._load_faces_cache():
+                    continue
+                if self.backend == 'rekognition':
+                    self._sync_collection()
+                else:
+                    self._build_index()
+            except Exception as e:
+                logger.error(f"Error refreshing stored faces: {e}")
+
+    @staticmethod
+    def _external_image_id(enrollment_code, face_hash):
+        """Collection id of a stored face, changes whenever the image changes"""
+        return f"{enrollment_code}:{face_hash[:16]}"
+
+    def _index_face(self, enrollment_code, face_path, external_image_id):
+        """Add a single stored face to the Rekognition collection"""
+        try:
+            response = self.rekognition_client.index_faces(
+                CollectionId=self.collection_id,
+                Image={'Bytes': self._read_face(face_path)},
+                ExternalImageId=external_image_id,
+                MaxFaces=1,
+                QualityFilter='AUTO'
+            )
+            if not response['FaceRecords']:
+                logger.warning(f"No face indexed for enrollment code {enrollment_code}")
+        except Exception as e:
+            logger.error(f"Error indexing face for {enrollment_code}: {e}")
+
+    def _sync_collection(self):
+        """Make the Rekognition collection match the stored faces"""
+        try:
+            try:
+                self.rekognition_client.create_collection(CollectionId=self.collection_id)
+                logger.info(f"Created Rekognition collection {self.collection_id}")
+            except self.rekognition_client.exceptions.ResourceAlreadyExistsException:
+                pass
+            
+            # Faces already in the collection: {external_image_id: [face_id, ...]}
+            indexed_faces = {}
+            paginator = self.rekognition_client.get_paginator('list_faces')
+            for page in paginator.paginate(CollectionId=self.collection_id):
+                for face in page['Faces']:
+                    indexed_faces.setdefault(face.get('ExternalImageId'), []).append(face['FaceId'])
+            
+            expected_faces = {
+                self._external_image_id(enrollment_code, face_hash): (enrollment_code, face_path)
+                for enrollment_code, (face_path, _, face_hash) in self._faces_cache.items()
+            }
+            
+            # Remove faces that were deleted or replaced
+            stale_face_ids = [
+                face_id
+                for external_image_id, face_ids in indexed_faces.items()
+                if external_image_id not in expected_faces
+                for face_id in face_ids
+            ]
+            for start in range(0, len(stale_face_ids), 4096):
+                self.rekognition_client.delete_faces(
+                    CollectionId=self.collection_id,
+                    FaceIds=stale_face_ids[start:start + 4096]
+                )
+            
+            # Index new faces concurrently
+            futures = [
+                self._pool.submit(self._index_face, enrollment_code, face_path, external_image_id)
+                for external_image_id, (enrollment_code, face_path) in expected_faces.items()
+                if external_image_id not in indexed_faces
+            ]
+            for future in futures:
+                future.result()
+            
+            logger.info(
+                f"Rekognition collection synced: {len(futures)} faces indexed, "
+                f"{len(stale_face_ids)} removed"
+            )
+        except Exception as e:
+            logger.error(f"Error syncing Rekognition collection: {e}")
+
+    def _build_index(self):
+        """Load the stored face embeddings into a FAISS index, embedding only new faces"""
+        import faiss
+
+        # Embeddings persisted by previous runs, keyed by image hash
+        stored_embeddings = {}
+        if os.path.exists(self.embeddings_path):
+            try:
+                with np.load(self.embeddings_path) as data:
+                    stored_embeddings = {face_hash: data[face_hash] for face_hash in data.files}
+            except Exception as e:
+                logger.warning(f"Could not load cached embeddings: {e}")
+
+        embeddings_by_hash = {}
+        embeddings = []
+        codes = []
+        for enrollment_code, (face_path, _, face_hash) in sorted(self._faces_cache.items()):
+            embedding = stored_embeddings.get(face_hash)
+            if embedding is None:
+                image = cv2.imread(face_path)
+                if image is None:
+                    logger.warning(f"Could not decode stored face for {enrollment_code}")
+                    continue
+
+                faces = self.face_analyzer.get(image, max_num=1)
+                if not faces:
+                    logger.warning(f"No face detected in stored face for {enrollment_code}")
+                    continue
+                embedding = self._largest_face(faces).normed_embedding
+
+            embeddings_by_hash[face_hash] = embedding
+            embeddings.append(embedding)
+            codes.append(enrollment_code)
+
+        if embeddings_by_hash.keys() != stored_embeddings.keys():
+            try:
+                np.savez(self.embeddings_path, **embeddings_by_hash)
+            except OSError as e:
+                logger.warning(f"Could not save cached embeddings: {e}")
+
+        index = faiss.IndexFlatL2(FACE_EMBEDDING_SIZE)
+        if embeddings:
+            index.add(np.stack(embeddings).astype(np.float32))
+        
+        # Swap in the new index without blocking recognition while building it
+        with self._index_lock:
+            self.index = index
+            self.index_codes = codes
+        logger.info(f"Indexed {len(codes)} stored faces")
+
     def compare_with_stored_faces(self, frame):
         """Compare captured frame with all faces stored in faces directory"""
+        if self.backend == 'rekognition':
+            return self._compare_with_rekognition(frame)
+        return self._compare_with_index(frame)
+
+    def _compare_with_index(self, frame):
+        """Match the largest face in the frame against the local embedding index"""
         try:
+            with self._index_lock:
+                index, index_codes = self.index, self.index_codes
+            if index is None or index.ntotal == 0:
+                return None, 0
+
+            start_time = time.perf_counter()
+            # Embed only the most prominent face
+            faces = self.face_analyzer.get(frame, max_num=1)
+            if not faces:
+                self.metrics.record('embedding', time.perf_counter() - start_time)
+                return None, 0
+
+            embedding = self._largest_face(faces).normed_embedding.astype(np.float32)
+            distances, indices = index.search(embedding[None, :], 1)
+            self.metrics.record('embedding', time.perf_counter() - start_time)
+            if indices[0][0] < 0:
+                return None, 0
+
+            # Embeddings are L2-normalized, so squared L2 distance maps to cosine similarity
+            cos_sim = 1 - float(distances[0][0]) / 2
+            if cos_sim < LOCAL_FACE_RECOGNITION_THRESHOLD:
+                return None, 0
+
+            enrollment_code = index_codes[indices[0][0]]
+            similarity = cos_sim * 100
+            logger.info(f"Match found for enrollment code {enrollment_code} with similarity {similarity:.2f}%")
+            return enrollment_code, similarity
+
+        except Exception as e:
+            logger.error(f"Error in face comparison process: {e}")
+            return None, 0
+
+    def _compare_with_rekognition(self, frame):
+        """Search the stored faces collection with AWS Rekognition"""
+        try:
+            start_time = time.perf_counter()
+            
+            # Downscale before encoding to cut JPEG cost and upload size
+            height, width = frame.shape[:2]
+            scale = self.upload_max_dim / max(height, width)
+            if scale < 1:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            
             # Convert frame to bytes for AWS Rekognition
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
+            if self._jpeg_encoder is not None:
+                frame_bytes = self._jpeg_encoder.encode(np.ascontiguousarray(frame), quality=80)
+            else:
+                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                frame_bytes = buffer.tobytes()
+            encoded_time = time.perf_counter()
+            self.metrics.record('encode', encoded_time - start_time)
             
-            # Iterate through all images in faces directory
-            for face_file in os.listdir(self.faces_directory):
-                if not face_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    continue
-                
-                # Get enrollment code from filename (without extension)
-                enrollment_code = os.path.splitext(face_file)[0]
-                
-                # Read stored face image
-                face_path = os.path.join(self.faces_directory, face_file)
-                with open(face_path, 'rb') as stored_face:
-                    stored_face_bytes = stored_face.read()
-                
-                try:
-                    # Compare faces using AWS Rekognition
-                    response = self.rekognition_client.compare_faces(
-                        SourceImage={'Bytes': frame_bytes},
-                        TargetImage={'Bytes': stored_face_bytes},
-                        SimilarityThreshold=FACE_RECOGNITION_THRESHOLD,
-                        QualityFilter='AUTO'
-                    )
-                    
-                    # Check if there's a match
-                    if response['FaceMatches']:
-                        similarity = response['FaceMatches'][0]['Similarity']
-                        logger.info(f"Match found for enrollment code {enrollment_code} with similarity {similarity:.2f}%")
-                        return enrollment_code, similarity
-                        
-                except Exception as e:
-                    logger.error(f"Error comparing face with {face_file}: {e}")
-                    continue
+            # Search the whole collection in a single call
+            try:
+                response = self.rekognition_client.search_faces_by_image(
+                    CollectionId=self.collection_id,
+                    Image={'Bytes': frame_bytes},
+                    FaceMatchThreshold=FACE_RECOGNITION_THRESHOLD,
+                    MaxFaces=1,
+                    QualityFilter='AUTO'
+                )
+            except self.rekognition_client.exceptions.InvalidParameterException:
+                # Raised when there is no face in the image
+                return None, 0
+            finally:
+                self.metrics.record('rekognition', time.perf_counter() - encoded_time)
+            
+            if response['FaceMatches']:
+                match = response['FaceMatches'][0]
+                enrollment_code = match['Face']['ExternalImageId'].rsplit(':', 1)[0]
+                similarity = match['Similarity']
+                logger.info(f"Match found for enrollment code {enrollment_code} with similarity {similarity:.2f}%")
+                return enrollment_code, similarity
                     
             return None, 0
             
@@ -83,38 +415,79 @@ class FaceRecognitionProcessor:
 
     def handle_recognition(self, enrollment_code, similarity, callback):
         """Handle successful recognition event"""
-        current_time = datetime.now()
+        current_time = time.monotonic()
         
         # Check if enough time has passed since last recognition
-        if enrollment_code in self.last_recognition_times:
-            time_diff = (current_time - self.last_recognition_times[enrollment_code]).total_seconds()
-            if time_diff < self.recognition_interval:
-                return
+        last_time = self.last_recognition_times.get(enrollment_code)
+        if last_time is not None and (current_time - last_time) < self.recognition_interval:
+            return
         
-        # Update last recognition time
+        # Update last recognition time, forgetting the oldest entries past the limit
         self.last_recognition_times[enrollment_code] = current_time
+        self.last_recognition_times.move_to_end(enrollment_code)
+        if len(self.last_recognition_times) > self.max_tracked_recognitions:
+            self.last_recognition_times.popitem(last=False)
         
         # Create attendance record
         attendance_record = AttendanceRecord(
             student_id=enrollment_code, #TODO: fix that later
             device_id=self.device_id,
-            capture_timestamp=current_time,
+            capture_timestamp=datetime.now(),
             confidence_score=similarity
         )
         
         # Call the callback function with the attendance record
         callback(attendance_record)
 
+    def _detect_faces(self, frame):
+        """Detect faces on a downscaled frame, returns boxes (x, y, w, h) in frame coordinates or None"""
+        height, width = frame.shape[:2]
+        small_frame = cv2.resize(frame, FACE_DETECTOR_INPUT_SIZE)
+        _, faces = self.face_detector.detect(small_frame)
+        if faces is None:
+            return None
+        
+        scale = np.array([
+            width / FACE_DETECTOR_INPUT_SIZE[0],
+            height / FACE_DETECTOR_INPUT_SIZE[1],
+            width / FACE_DETECTOR_INPUT_SIZE[0],
+            height / FACE_DETECTOR_INPUT_SIZE[1]
+        ])
+        return faces[:, :4] * scale
+
+    @staticmethod
+    def _crop_to_face(frame, boxes, margin=0.5):
+        """Crop the frame around the largest detected face, keeping some margin"""
+        height, width = frame.shape[:2]
+        x, y, w, h = max(boxes, key=lambda box: box[2] * box[3])
+        x1 = max(0, int(x - w * margin))
+        y1 = max(0, int(y - h * margin))
+        x2 = min(width, int(x + w * (1 + margin)))
+        y2 = min(height, int(y + h * (1 + margin)))
+        return frame[y1:y2, x1:x2]
+
     def process_frame(self, frame, callback):
         """Process a single frame for face recognition"""
         try:
+            start_time = time.perf_counter()
+            if self.face_detector is not None:
+                boxes = self._detect_faces(frame)
+                self.metrics.record('detect', time.perf_counter() - start_time)
+                if boxes is None:
+                    return None
+                
+                # Send Rekognition a tighter image around the face
+                if self.backend == 'rekognition':
+                    frame = self._crop_to_face(frame, boxes)
+            
             enrollment_code, similarity = self.compare_with_stored_faces(frame)
             if enrollment_code:
                 self.handle_recognition(enrollment_code, similarity, callback)
                 # Update text display time and content
                 self.last_recognition_text = f"Face Recognized: {enrollment_code}"
                 self.text_display_time = time.time()
-                
+            
+            self.metrics.record('process', time.perf_counter() - start_time)
             return enrollment_code
         except Exception as e:
             logger.error(f"Error processing frame: {e}")
@@ -124,7 +497,13 @@ class FaceRecognitionProcessor:
     def start_camera(self, camera_index=0):
         """Start the camera capture"""
         try:
-            self.camera = cv2.VideoCapture(camera_index)
+            # Let the capture backend use hardware decoding when it supports it
+            self.camera = cv2.VideoCapture(
+                camera_index, cv2.CAP_ANY,
+                [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+            )
+            # Ask for compressed MJPG frames, which the camera delivers faster than raw YUV
+            self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
             # Reduce resolution for better performance
             self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
             self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
@@ -135,25 +514,91 @@ class FaceRecognitionProcessor:
             logger.error(f"Error starting camera: {e}")
             raise
 
-    def run_recognition(self, callback):
-        """Run the face recognition process"""
-        self.is_running = True
-        last_process_time = time.time()
+    @staticmethod
+    def _put_latest(queue, item):
+        """Put an item on a bounded queue, dropping the oldest item when full"""
+        try:
+            queue.put_nowait(item)
+        except Full:
+            try:
+                queue.get_nowait()
+            except Empty:
+                pass
+            try:
+                queue.put_nowait(item)
+            except Full:
+                pass
+
+    def _reader_loop(self):
+        """Grab frames from the camera and publish the ones worth decoding"""
+        last_display_time = 0
+        # Without a window frames are only needed for recognition
+        decode_interval = self.display_interval if self.show_ui else self.recognition_interval
         
         while self.is_running:
             try:
-                ret, frame = self.camera.read()
-                if not ret:
+                # Advance the stream without decoding; grab() blocks until the
+                # camera delivers the next frame, which paces this loop
+                start_time = time.perf_counter()
+                if not self.camera.grab():
                     logger.error("Failed to capture frame")
+                    time.sleep(0.1)
+                    continue
+                grabbed_time = time.perf_counter()
+                self.metrics.record('grab', grabbed_time - start_time)
+                
+                # Only decode frames at the display cadence, or the recognition
+                # interval when there is no window
+                current_time = time.time()
+                if (current_time - last_display_time) < decode_interval:
                     continue
                 
-                # Process frame at specified interval
+                ret, frame = self.camera.retrieve()
+                if not ret:
+                    logger.error("Failed to decode frame")
+                    continue
+                last_display_time = current_time
+                self.metrics.record('decode', time.perf_counter() - grabbed_time)
+                
+                # Drop the oldest frame if the worker is still busy, so it always
+                # picks up the most recent one
+                self._put_latest(self.read_queue, frame)
+                self.metrics.observe_queue('read_queue', self.read_queue.qsize())
+                
+            except Exception as e:
+                logger.error(f"Error in camera reader: {e}")
+
+    def _worker_loop(self, callback):
+        """Run recognition on the newest frame and annotate frames for display"""
+        last_process_time = time.time()
+        
+        while self.is_running:
+            try:
+                try:
+                    frame = self.read_queue.get(timeout=1)
+                except Empty:
+                    continue
+                
+                # Skip stale frames and keep only the newest one
+                while True:
+                    try:
+                        frame = self.read_queue.get_nowait()
+                    except Empty:
+                        break
+                
+                # Process frame at specified interval, the reader already
+                # throttles frames to that interval when headless
                 current_time = time.time()
-                if (current_time - last_process_time) >= self.recognition_interval:
-                    # Process frame and get recognition result
-                    recognition_result = self.process_frame(frame.copy(), callback)
+                if not self.show_ui or (current_time - last_process_time) >= self.recognition_interval:
+                    # Process frame and get recognition result; processing only reads
+                    # the frame and the overlay is drawn after it returns
+                    recognition_result = self.process_frame(frame, callback)
                     last_process_time = current_time
                 
+                if not self.show_ui:
+                    self.metrics.maybe_log()
+                    continue
+                
                 # Display text if within duration window
                 if self.last_recognition_text and self.text_display_time:
                     if (current_time - self.text_display_time) <= self.text_duration:
@@ -170,23 +615,87 @@ class FaceRecognitionProcessor:
                         self.last_recognition_text = None
                         self.text_display_time = None
                 
-                # Show the webcam feed in a window
-                cv2.imshow('Smart Check', frame)
+                self._put_latest(self.display_queue, frame)
+                self.metrics.observe_queue('display_queue', self.display_queue.qsize())
+                self.metrics.maybe_log()
+                
+            except Exception as e:
+                logger.error(f"Error in recognition worker: {e}")
+
+    def run_recognition(self, callback):
+        """Run the face recognition process until 'q', SIGTERM or stop(); callers
+        must call stop() afterwards to release the camera"""
+        self.is_running = True
+        sigterm_installed = False
+        previous_sigterm_handler = None
+        
+        # Camera reading and recognition run in background threads,
+        # the GUI (if enabled) stays on the calling (main) thread
+        threads = [
+            threading.Thread(target=self._reader_loop, name="camera-reader", daemon=True),
+            threading.Thread(target=self._worker_loop, args=(callback,), name="recognition-worker", daemon=True),
+            threading.Thread(target=self._faces_refresh_loop, name="faces-refresh", daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            if self.show_ui:
+                self._run_display_loop()
+            else:
+                # Headless: stop on SIGTERM instead of the 'q' key
+                if threading.current_thread() is threading.main_thread():
+                    previous_sigterm_handler = signal.signal(signal.SIGTERM, self._handle_sigterm)
+                    sigterm_installed = True
+                while self.is_running and threads[1].is_alive():
+                    threads[1].join(timeout=0.5)
+        finally:
+            self.is_running = False
+            # Give SIGTERM back to whoever handled it before
+            if sigterm_installed:
+                signal.signal(signal.SIGTERM, previous_sigterm_handler or signal.SIG_DFL)
+            for thread in threads:
+                thread.join(timeout=5)
+
+    def _handle_sigterm(self, signum, frame):
+        """Stop the recognition loops when the process is asked to terminate"""
+        logger.info("Termination requested, stopping recognition")
+        self.is_running = False
+
+    def _run_display_loop(self):
+        """Show annotated frames until 'q' is pressed or recognition stops"""
+        next_display_time = time.monotonic()
+        while self.is_running:
+            try:
+                try:
+                    frame = self.display_queue.get_nowait()
+                    # Show the webcam feed in a window
+                    cv2.imshow('Smart Check', frame)
+                except Empty:
+                    pass
+                
+                # Wait in the GUI event loop until the next frame is due; the
+                # deadline only moves once it has passed, so early key presses
+                # do not push it further away
+                now = time.monotonic()
+                if now >= next_display_time:
+                    next_display_time = now + self.display_interval
+                wait_ms = max(1, int((next_display_time - now) * 1000))
                 
                 # Exit when the 'q' key is pressed
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                if cv2.waitKey(wait_ms) & 0xFF == ord('q'):
                     break
                 
             except Exception as e:
                 logger.error(f"Error in recognition loop: {e}")
-                
-            # Small delay to prevent excessive CPU usage
-            time.sleep(0.1)
 
     def stop(self):
         """Stop the face recognition process"""
         self.is_running = False
+        if self.backend == 'rekognition':
+            self._pool.shutdown(wait=False)
         if self.camera:
             self.camera.release()
-        cv2.destroyAllWindows()
+        if self.show_ui:
+            cv2.destroyAllWindows()
         logger.info("Camera stopped and window closed")
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+class PipelineMetrics:
+    """Rolling per-stage timings and queue high-water marks for the camera pipeline"""
+
+    def __init__(self, device_id: str, window: int = 100, log_interval: int = 5, port: int = 0):
+        self.device_id = device_id
+        self.window = window
+        self.log_interval = log_interval  # seconds
+        self._stats = {}  # {stage: deque of durations in seconds}
+        self._queue_high_water = {}  # {queue name: max size since last log}
+        self._lock = threading.Lock()
+        self._last_log_time = time.monotonic()
+
+        # Optional Prometheus endpoint
+        self._stage_summary = None
+        self._queue_gauge = None
+        if port:
+            self._start_http_server(port)
+
+    def _start_http_server(self, port: int):
+        try:
+            from prometheus_client import Gauge, Summary, start_http_server
+            self._stage_summary = Summary(
+                'attendance_pipeline_stage_seconds',
+                'Time spent in each camera pipeline stage',
+                ['device_id', 'stage']
+            )
+            self._queue_gauge = Gauge(
+                'attendance_pipeline_queue_high_water',
+                'Highest queue depth seen in the last log interval',
+                ['device_id', 'queue']
+            )
+            start_http_server(port)
+            logger.info(f"Metrics available on port {port}")
+        except Exception as e:
+            logger.error(f"Error starting metrics server: {e}")
+
+    def record(self, stage: str, seconds: float):
+        """Record the duration of a pipeline stage"""
+        with self._lock:
+            if stage not in self._stats:
+                self._stats[stage] = deque(maxlen=self.window)
+            self._stats[stage].append(seconds)
+        if self._stage_summary is not None:
+            self._stage_summary.labels(self.device_id, stage).observe(seconds)
+
+    def observe_queue(self, name: str, size: int):
+        """Track the highest depth seen for a queue"""
+        with self._lock:
+            if size > self._queue_high_water.get(name, 0):
+                self._queue_high_water[name] = size
+
+    def maybe_log(self):
+        """Log p50/p95 per stage and queue high-water marks once per log interval"""
+        now = time.monotonic()
+        if now - self._last_log_time < self.log_interval:
+            return
+        self._last_log_time = now
+
+        with self._lock:
+            stats = {stage: list(durations) for stage, durations in self._stats.items()}
+            queue_high_water = dict(self._queue_high_water)
+            self._queue_high_water.clear()
+
+        parts = []
+        for stage, durations in sorted(stats.items()):
+            if durations:
+                p50, p95 = np.percentile(durations, [50, 95]) * 1000
+                parts.append(f"{stage} p50={p50:.1f}ms p95={p95:.1f}ms")
+        for name, size in sorted(queue_high_water.items()):
+            parts.append(f"{name} max={size}")
+            if self._queue_gauge is not None:
+                self._queue_gauge.labels(self.device_id, name).set(size)
+
+        if parts:
+            logger.info(f"Pipeline metrics: {', '.join(parts)}")
@@ -37,6 +37,9 @@ class CameraSystem:
             self.face_recognition.start_camera(camera_index=CAMERA_INDEX)
             self.face_recognition.run_recognition(self.handle_recognition)
             
+            # Recognition returned on 'q' or SIGTERM, release the camera
+            self.stop()
+            
         except Exception as e:
             logger.error(f"Error in camera system: {e}")
             self.stop()